@@ -1,8 +1,14 @@
 ﻿from firecrawl import Firecrawl
 from google import genai
-import os, textwrap, json
+from google.genai import errors as genai_errors
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+import httpx
+import os, io, textwrap, json, hashlib, sqlite3, threading, time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from pathlib import Path
+from typing import Optional
+from pydantic import BaseModel
 
 # Load .env: prefer project root .env (one level up from script)
 env_path = Path(__file__).resolve().parents[1] / ".env"
@@ -14,17 +20,127 @@ GENAI_API_KEY = os.getenv("GENAI_API_KEY")
 if not FIRECRAWL_API_KEY or not GENAI_API_KEY:
     raise RuntimeError(f"FIRECRAWL_API_KEY and GENAI_API_KEY must be set in environment or .env (tried {env_path})")
 
+# One keep-alive pool for every genAI call in a run (LLM calls can be slow, so no client timeout)
+http_client = httpx.Client(timeout=None, limits=httpx.Limits(max_connections=20, max_keepalive_connections=20))
+
 firecrawl = Firecrawl(api_key=FIRECRAWL_API_KEY)
-genai_client = genai.Client(api_key=GENAI_API_KEY)
+genai_client = genai.Client(api_key=GENAI_API_KEY, http_options={"httpx_client": http_client})
 
 DEFAULT_SCRAPE_OPTS = {
-    "formats": ["markdown", "links"],
+    "formats": ["markdown"],  # links are never read
     "only_main_content": True,
     "timeout": 120000,
     "location": {"languages": ["en"]},
     "parsers": [],  # disable PDFs if you want to avoid extra cost
 }
 
+# genAI model for summaries and the final report
+MODEL_SYNTH = "gemini-2.5-flash"
+
+# Review pages shorter than this are passed to the final call unsummarized
+SHORT_DOC_CHARS = 2500
+
+# Max URLs per Firecrawl batch scrape job
+FIRECRAWL_BATCH_SIZE = int(os.getenv("FIRECRAWL_BATCH_SIZE", "10"))
+
+# On-disk cache for scraped markdown (by URL) and summaries (by URL + content hash)
+CACHE_PATH = Path(__file__).resolve().parents[1] / ".cache" / "carchecker.sqlite3"
+SCRAPE_CACHE_MAX_AGE = int(os.getenv("SCRAPE_CACHE_MAX_AGE", str(7 * 24 * 3600)))  # seconds
+
+# Response schemas for structured (JSON) genAI output
+class Spec(BaseModel):
+    source_url: Optional[str]
+    brand: Optional[str]
+    model: Optional[str]
+    year_range: Optional[str]
+    engine_type_and_displacement: Optional[str]
+    horsepower: Optional[str]
+    torque: Optional[str]
+    fuel_economy: Optional[str]
+    acceleration: Optional[str]
+    top_speed: Optional[str]
+    notable_features: Optional[str]
+
+class DocSummary(BaseModel):
+    id: int
+    summary: str
+
+class FinalReport(BaseModel):
+    specs: list[Spec]
+    report: str
+
+_cache_conn = None
+_cache_lock = threading.Lock()
+
+def _get_cache():
+    global _cache_conn
+    if _cache_conn is None:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _cache_conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _cache_conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (kind TEXT, key TEXT, value TEXT, created REAL, PRIMARY KEY (kind, key))"
+        )
+    return _cache_conn
+
+def cache_get(kind, key, max_age=None):
+    with _cache_lock:
+        row = _get_cache().execute("SELECT value, created FROM cache WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+    if not row:
+        return None
+    value, created = row
+    if max_age is not None and time.time() - created > max_age:
+        return None
+    return value
+
+def cache_set(kind, key, value):
+    with _cache_lock:
+        conn = _get_cache()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (kind, key, value, created) VALUES (?, ?, ?, ?)",
+            (kind, key, value, time.time()),
+        )
+        conn.commit()
+
+def _summary_key(md_text, url):
+    return f"{url}:{hashlib.sha256(md_text.encode('utf-8')).hexdigest()}"
+
+# Token counts accumulated across every _gemini_call, for cost tracking
+TOKEN_USAGE = {
+    "calls": 0,
+    "prompt_token_count": 0,
+    "cached_content_token_count": 0,
+    "candidates_token_count": 0,
+    "total_token_count": 0,
+}
+
+_RETRYABLE_CODES = {429, 500, 502, 503, 504}
+_backoff = wait_exponential_jitter(initial=1, max=30)
+
+def _is_retryable(exc):
+    return isinstance(exc, genai_errors.APIError) and exc.code in _RETRYABLE_CODES
+
+def _retry_wait(retry_state):
+    # honor the server's Retry-After header when there is one, else back off exponentially
+    response = getattr(retry_state.outcome.exception(), "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return min(float(headers.get("retry-after")), 60)
+    except (TypeError, ValueError):
+        return _backoff(retry_state)
+
+@retry(retry=retry_if_exception(_is_retryable), wait=_retry_wait, stop=stop_after_attempt(5), reraise=True)
+def _gemini_call(contents, model=MODEL_SYNTH, **kw):
+    """
+    generate_content with retry on rate limits / server errors; adds the response's
+    usage_metadata to TOKEN_USAGE.
+    """
+    resp = genai_client.models.generate_content(model=model, contents=contents, **kw)
+    usage = getattr(resp, "usage_metadata", None)
+    TOKEN_USAGE["calls"] += 1
+    for field in ("prompt_token_count", "cached_content_token_count", "candidates_token_count", "total_token_count"):
+        TOKEN_USAGE[field] += getattr(usage, field, None) or 0
+    return resp
+
 def _model_to_dict(obj):
     if not obj:
         return {}
@@ -40,62 +156,72 @@ def _model_to_dict(obj):
             pass
     return {}
 
+def _markdown_from_dict(d):
+    return d.get("markdown") or (d.get("data") or {}).get("markdown", "") or ""
+
+def _url_from_dict(d):
+    return (
+        d.get("url")
+        or d.get("sourceURL")
+        or (d.get("metadata") or {}).get("sourceURL")
+        or (d.get("metadata") or {}).get("url")
+        or (d.get("metadata") or {}).get("source_url")
+    )
+
+def _url_from_attrs(item):
+    url = getattr(item, "url", None) or getattr(item, "sourceURL", None)
+    if url:
+        return url
+    md = getattr(item, "metadata", None)
+    if md:
+        return getattr(md, "source_url", None) or getattr(md, "sourceURL", None) or getattr(md, "url", None) or getattr(md, "og_url", None)
+    return None
+
 def safe_get_markdown(item):
     if not item:
         return ""
     if isinstance(item, dict):
-        return item.get("markdown") or (item.get("data") or {}).get("markdown", "") or ""
+        return _markdown_from_dict(item)
     md = getattr(item, "markdown", None)
     if isinstance(md, str):
         return md
     if hasattr(item, "model_dump") or hasattr(item, "dict"):
-        d = _model_to_dict(item)
-        return d.get("markdown") or (d.get("data") or {}).get("markdown", "") or ""
+        return _markdown_from_dict(_model_to_dict(item))
     return ""
 
 def safe_get_url(item):
     if not item:
         return None
     if isinstance(item, dict):
-        return (
-            item.get("url")
-            or item.get("sourceURL")
-            or (item.get("metadata") or {}).get("sourceURL")
-            or (item.get("metadata") or {}).get("url")
-            or (item.get("metadata") or {}).get("source_url")
-        )
-    url = getattr(item, "url", None) or getattr(item, "sourceURL", None)
+        return _url_from_dict(item)
+    url = _url_from_attrs(item)
     if url:
         return url
-    md = getattr(item, "metadata", None)
-    if md:
-        return getattr(md, "source_url", None) or getattr(md, "sourceURL", None) or getattr(md, "url", None) or getattr(md, "og_url", None)
+    if getattr(item, "metadata", None):
+        return None
     if hasattr(item, "model_dump") or hasattr(item, "dict"):
-        d = _model_to_dict(item)
-        return (
-            d.get("url")
-            or d.get("sourceURL")
-            or (d.get("metadata") or {}).get("sourceURL")
-            or (d.get("metadata") or {}).get("url")
-            or (d.get("metadata") or {}).get("source_url")
-        )
+        return _url_from_dict(_model_to_dict(item))
     return None
 
-def chunk_text(text, max_chars=3000):
-    # naive chunking by characters; adjust to tokens if you have a tokenizer
-    text = text.strip()
-    if not text:
-        return []
-    chunks = []
-    while text:
-        chunk = text[:max_chars]
-        # try to cut at last paragraph/newline for better context
-        cut = chunk.rfind("\n\n")
-        if cut > max_chars // 2:
-            chunk = text[:cut]
-        chunks.append(chunk.strip())
-        text = text[len(chunk):].lstrip()
-    return chunks
+def _extract_once(item):
+    """
+    Return (url, markdown) for item, serializing it with _model_to_dict at most once.
+    """
+    if not item:
+        return None, ""
+    if isinstance(item, dict):
+        return _url_from_dict(item), _markdown_from_dict(item)
+    url = _url_from_attrs(item)
+    md = getattr(item, "markdown", None)
+    if not isinstance(md, str):
+        md = None
+    if (url is None or md is None) and (hasattr(item, "model_dump") or hasattr(item, "dict")):
+        d = _model_to_dict(item)
+        if url is None:
+            url = _url_from_dict(d)
+        if md is None:
+            md = _markdown_from_dict(d)
+    return url, md or ""
 
 def _compress_for_single_request(text, max_chars=20000):
     """
@@ -115,88 +241,72 @@ def _compress_for_single_request(text, max_chars=20000):
     end = text[-part:]
     return "\n\n--START--\n\n" + start + "\n\n--MIDDLE--\n\n" + middle + "\n\n--END--\n\n" + end
 
-def summarize_chunk(chunk):
-    prompt = textwrap.dedent(f"""
-    Summarize this excerpt in 2-3 short sentences focused on car review insights: main issues, recurring problems, and positives.
-
-    Excerpt:
-    {chunk}
-    """).strip()
-    resp = genai_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-    )
-    return getattr(resp, "text", repr(resp))
-
-def summarize_document(md_text, url):
-    if not md_text:
-        return None
-    payload_text = _compress_for_single_request(md_text, max_chars=20000)
-    prompt = textwrap.dedent(f"""
-    Produce a concise summary of the following document in 2 short paragraphs (2-5 sentences each).
+_BATCH_TMPL = textwrap.dedent("""
+    You are given several documents, each starting with a ---DOC <id>--- marker followed by a JSON object with "id", "url" and "content".
+    For each document produce a concise summary in 2 short paragraphs (2-5 sentences each).
     Focus on: main drawbacks, common mechanical issues (mention relative frequency if present), and main positives.
-    End with a single-line source attribution exactly as: Source: {url}
-
-    Document:
-    {payload_text}
-    """).strip()
-    resp = genai_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-    )
-    return getattr(resp, "text", repr(resp))
+    End each summary with a single-line source attribution exactly as: Source: <url of that document>
 
-def extract_specs_from_docs(specs_texts, urls):
-    """
-    Single genAI call to extract structured specs from combined spec docs.
-    Return a list/dict of extracted spec entries (best-effort).
-    """
-    combined = "\n\n---\n\n".join([f"URL: {u}\n\n{t}" for u, t in zip(urls, specs_texts)])
-    prompt = textwrap.dedent(f"""
-    You are given several specification documents for a car. For each document, extract the following fields if present:
-    - brand
-    - model
-    - year_range
-    - engine_type_and_displacement
-    - horsepower
-    - torque
-    - fuel_economy
-    - acceleration
-    - top_speed
-    - notable_features (comma separated list)
-
-    Output a JSON array with one object per source in the same order. Each object must include "source_url" and the fields above (use null for missing fields). Example:
-    [
-      {{
-        "source_url": "...",
-        "brand": "...",
-        "model": "...",
-        "year_range": "...",
-        "engine_type_and_displacement": "...",
-        "horsepower": "...",
-        "torque": "...",
-        "fuel_economy": "...",
-        "acceleration": "...",
-        "top_speed": "...",
-        "notable_features": "..."
-      }},
-      ...
-    ]
+    Return one object per document with its "id" and "summary".
 
     Documents:
     {combined}
-    """).strip()
-    resp = genai_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
+""").strip()
+
+def summarize_documents_batched(docs):
+    """
+    Single genAI call to summarize several documents at once.
+    docs is a list of (md_text, url) pairs; returns a list of summaries in the same order
+    (None where the model produced nothing for a document).
+    """
+    if not docs:
+        return []
+    results = [None] * len(docs)
+    keys = [_summary_key(md_text, url) for md_text, url in docs]
+    pending = []
+    for i, key in enumerate(keys):
+        results[i] = cache_get("summary", key)
+        if not results[i]:
+            pending.append(i)
+    if not pending:
+        return results
+    sections = []
+    for i in pending:
+        md_text, url = docs[i]
+        payload_text = _compress_for_single_request(md_text, max_chars=20000)
+        sections.append(f"---DOC {i}---\n" + json.dumps({"id": i, "url": url, "content": payload_text}))
+    combined = "\n\n".join(sections)
+    prompt = _BATCH_TMPL.format(combined=combined)
+    resp = _gemini_call(
+        prompt,
+        config={"response_mime_type": "application/json", "response_schema": list[DocSummary]},
     )
-    text = getattr(resp, "text", repr(resp))
-    try:
-        parsed = json.loads(text)
-        return parsed
-    except Exception:
-        # model didn't return strict JSON; return raw text as fallback
-        return {"raw": text}
+    wanted = set(pending)
+    for entry in resp.parsed or []:
+        if entry.id in wanted:
+            results[entry.id] = entry.summary or None
+    for i in pending:
+        if results[i]:
+            cache_set("summary", keys[i], results[i])
+    return results
+
+def _strip_source_line(summary):
+    head, sep, tail = summary.rstrip().rpartition("\n")
+    if sep and tail.strip().startswith("Source:"):
+        return head.rstrip()
+    return summary
+
+def _combine_specs(specs_texts, urls):
+    # write sections straight into one buffer instead of building a list of formatted copies
+    buf = io.StringIO()
+    for i, (u, t) in enumerate(zip(urls, specs_texts)):
+        if i:
+            buf.write("\n\n---\n\n")
+        buf.write("URL: ")
+        buf.write(u)
+        buf.write("\n\n")
+        buf.write(t)
+    return buf.getvalue()
 
 def normalize_results(results):
     if isinstance(results, list):
@@ -211,69 +321,57 @@ def normalize_results(results):
     except Exception:
         return []
 
-def search_and_summarize(querySearch, querySpecs, searchLimit, specLimit, scrape_options=None, max_genai_calls=10, car_type=None):
+def scrape_urls(urls, opts):
     """
-    Strategy to remain under max_genai_calls:
-      - 1 genAI call to extract specs (combined spec docs)
-      - N genAI calls (<= max_genai_calls - 2) one per document summary
-      - 1 genAI call to synthesize final report
+    Scrape urls with Firecrawl, using one batch scrape job per FIRECRAWL_BATCH_SIZE urls
+    when there are at least 2 of them. Pages scraped within SCRAPE_CACHE_MAX_AGE are served
+    from the disk cache. Returns {url: markdown}; failed urls are left out.
     """
-    print("Running")
-    if scrape_options:
-        opts = DEFAULT_SCRAPE_OPTS.copy()
-        opts.update(scrape_options)
-    else:
-        opts = DEFAULT_SCRAPE_OPTS.copy()
-
-    # Reserve 2 calls: one for specs extraction and one final synthesis
-    allowed_doc_calls = max(0, max_genai_calls - 2)
-    doc_limit = min(searchLimit, allowed_doc_calls)
-
-    # Firecrawl searches
-    results = firecrawl.search(query=querySearch, limit=doc_limit, scrape_options=opts)
-    resultsSpecs = firecrawl.search(query=querySpecs, limit=specLimit, scrape_options=opts)
-
-    items = normalize_results(results)
-    SpecsItems = normalize_results(resultsSpecs)
-    print("FireCrawl done")
-    if isinstance(items, dict) and "web" in items:
-        items = items["web"]
-
-    # Per-document summaries (bounded by doc_limit)
-    summaries = []
-    for item in items:
-        if len(summaries) >= doc_limit:
-            break
-        url = safe_get_url(item)
-        md = safe_get_markdown(item)
-        if not md:
-            continue
-        doc_summary = summarize_document(md, url)
-        if doc_summary:
-            summaries.append({"url": url, "summary": doc_summary})
-
-    # Specs: combine spec markdown and do single extraction call
-    specs_texts = []
-    specs_urls = []
-    for s in SpecsItems[:specLimit]:
-        url = safe_get_url(s)
-        md = safe_get_markdown(s)
+    scraped = {}
+    for url in urls:
+        md = cache_get("scrape", url, max_age=SCRAPE_CACHE_MAX_AGE)
         if md:
-            specs_texts.append(md)
-            specs_urls.append(url or "unknown")
-    specs_structured = extract_specs_from_docs(specs_texts, specs_urls) if specs_texts else []
-
-    # Synthesize final answer with a single final call
-    combined_summaries = "\n\n".join([f"From {s['url']}:\n{s['summary']}" for s in summaries])
-    specsDoc = json.dumps(specs_structured, indent=2) if specs_texts else "No specs found."
-
-    # Determine a readable car_type for the prompt
-    car_label = car_type or querySearch
-    print("Summaries done, writing report")
-    final_prompt = textwrap.dedent(f"""
-    Using the following per-document summaries and the extracted specification data, produce a 2-3 paragraph concise summary of {car_label} reviews.
+            scraped[url] = md
+    urls = [u for u in urls if u not in scraped]
+    if len(urls) < 2:
+        for url in urls:
+            try:
+                md = safe_get_markdown(firecrawl.scrape(url, **opts))
+            except Exception as e:
+                print(f"Scrape failed for {url}: {e}")
+                continue
+            if md:
+                scraped[url] = md
+                cache_set("scrape", url, md)
+        return scraped
+    for start in range(0, len(urls), FIRECRAWL_BATCH_SIZE):
+        batch = urls[start:start + FIRECRAWL_BATCH_SIZE]
+        try:
+            job = firecrawl.batch_scrape(batch, **opts)
+        except Exception as e:
+            print(f"Batch scrape failed for {len(batch)} urls: {e}")
+            continue
+        docs = getattr(job, "data", None) or normalize_results(job)
+        for doc in docs:
+            url, md = _extract_once(doc)
+            if url and md:
+                scraped[url] = md
+                cache_set("scrape", url, md)
+        for url in batch:
+            if url not in scraped:
+                print(f"Scrape failed for {url}: no markdown in batch scrape result")
+    return scraped
+
+_FINAL_TMPL = textwrap.dedent("""
+    You are given per-document review summaries (or full text for short reviews) and raw specification documents for {car_label}.
+    Return an object with two fields:
+
+    specs: one object per specification document in the same order, with its "source_url" and these fields (use null for missing fields):
+    brand, model, year_range, engine_type_and_displacement, horsepower, torque, fuel_economy, acceleration, top_speed, notable_features (comma separated list)
+
+    report: a 2-3 paragraph concise summary of {car_label} reviews, based on the summaries and the specification data.
     Focus on: main drawbacks, common mechanical issues (with frequency), and main positives.
-    Structure the response exactly as follows:
+    Structure the report exactly as follows:
 
     Brand: [Car Brand]
     Model: [Car Model]
@@ -306,23 +404,125 @@ def search_and_summarize(querySearch, querySpecs, searchLimit, specLimit, scrape
     Sources:
     [list of source URLs supporting major points]
 
-    Documents:
+    Documents (JSON list; "i" is the document id, "u" its URL, "s" its summary, or "d" its full text for short documents; cite documents by i):
     {combined_summaries}
 
-    Extracted Specifications (JSON):
+    Specification Documents:
     {specsDoc}
-    """).strip()
+""").strip()
+
+def search_and_summarize(querySearch, querySpecs, searchLimit, specLimit, scrape_options=None, max_genai_calls=10, car_type=None):
+    """
+    Strategy to remain under max_genai_calls:
+      - 1 genAI call to summarize up to max_genai_calls - 2 documents (batched)
+      - 1 genAI call to extract specs and synthesize the final report
+    Returns (final_report, summaries, specs).
+    """
+    print("Running")
+    if scrape_options:
+        opts = DEFAULT_SCRAPE_OPTS.copy()
+        opts.update(scrape_options)
+    else:
+        opts = DEFAULT_SCRAPE_OPTS.copy()
+
+    # Keep the historical budget of max_genai_calls - 2 documents; it now bounds how many
+    # documents go into the batched summary call
+    allowed_doc_calls = max(0, max_genai_calls - 2)
+    doc_limit = min(searchLimit, allowed_doc_calls)
+
+    # Firecrawl searches (URLs only) are independent, run them concurrently
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results_future = pool.submit(firecrawl.search, query=querySearch, limit=doc_limit)
+        specs_future = pool.submit(firecrawl.search, query=querySpecs, limit=specLimit)
+        results = results_future.result()
+        resultsSpecs = specs_future.result()
+
+    items = normalize_results(results)
+    SpecsItems = normalize_results(resultsSpecs)
+    if isinstance(items, dict) and "web" in items:
+        items = items["web"]
+
+    # Dedupe by URL; a page that ranks in both searches only goes down the specs path
+    spec_urls = []
+    seen = set()
+    for s in SpecsItems[:specLimit]:
+        url = safe_get_url(s)
+        if url and url not in seen:
+            seen.add(url)
+            spec_urls.append(url)
+    review_urls = []
+    for item in items[:doc_limit]:
+        url = safe_get_url(item)
+        if url and url not in seen:
+            seen.add(url)
+            review_urls.append(url)
+
+    # Scrape review and spec pages together, then route markdown back by URL
+    scraped = scrape_urls(review_urls + spec_urls, opts)
+    print("FireCrawl done")
+
+    # Per-document inputs (bounded by doc_limit); short pages skip summarization and go
+    # into the final prompt as-is
+    docs = []
+    short_docs = []
+    for url in review_urls:
+        md = scraped.get(url)
+        if not md:
+            continue
+        if len(md) < SHORT_DOC_CHARS:
+            short_docs.append({"url": url, "raw_md": md.strip()})
+        else:
+            docs.append((md, url))
+
+    # Specs: raw spec markdown goes straight into the final call
+    specs_texts = []
+    specs_urls = []
+    for url in spec_urls:
+        md = scraped.get(url)
+        if md:
+            specs_texts.append(_compress_for_single_request(md, max_chars=20000))
+            specs_urls.append(url)
+
+    doc_summaries = summarize_documents_batched(docs)
+    summaries = [
+        {"url": url, "summary": doc_summary}
+        for (_, url), doc_summary in zip(docs, doc_summaries)
+        if doc_summary
+    ]
+
+    # Extract specs and synthesize the final answer in a single final call
+    # Compact, id-keyed summaries; the trailing "Source:" line would only repeat "u"
+    entries = [{"u": s["url"], "s": _strip_source_line(s["summary"])} for s in summaries]
+    entries += [{"u": d["url"], "d": d["raw_md"]} for d in short_docs]
+    combined_summaries = json.dumps(
+        [{"i": n, **e} for n, e in enumerate(entries, 1)],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    specsDoc = _combine_specs(specs_texts, specs_urls) if specs_texts else "No specs found."
+
+    # Determine a readable car_type for the prompt
+    car_label = car_type or querySearch
+    print("Summaries done, writing report")
+    final_prompt = _FINAL_TMPL.format(
+        car_label=car_label,
+        combined_summaries=combined_summaries,
+        specsDoc=specsDoc,
+    )
 
-    resp = genai_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=final_prompt,
+    resp = _gemini_call(
+        final_prompt,
+        config={"response_mime_type": "application/json", "response_schema": FinalReport},
     )
-    final_text = getattr(resp, "text", repr(resp))
-    return final_text, summaries
+    parsed = resp.parsed
+    if parsed is None:
+        return getattr(resp, "text", repr(resp)), summaries, []
+    return parsed.report, summaries, [spec.model_dump() for spec in parsed.specs]
 
 if __name__ == "__main__":
     car_type = "porsche cayman 2007"
     searchLimit = 5
     specLimit = 3
-    final, sources = search_and_summarize(f"{car_type} buy guide", f"{car_type} spec sheet carfolio", searchLimit, specLimit, max_genai_calls=10, car_type=car_type)
-    print("FINAL SUMMARY:\n", final)
\ No newline at end of file
+    final, sources, specs = search_and_summarize(f"{car_type} buy guide", f"{car_type} spec sheet carfolio", searchLimit, specLimit, max_genai_calls=10, car_type=car_type)
+    print("FINAL SUMMARY:\n", final)
+    print("\nTOKEN USAGE:\n", TOKEN_USAGE)
\ No newline at end of file
@@ -1,6 +1,8 @@
 from firecrawl import Firecrawl
 from google import genai
-import os, textwrap
+from google.genai import errors as genai_errors
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+import os, re, bisect, textwrap
 
 FIRECRAWL_API_KEY = "fc-YOUR-API-KEY"
 GENAI_API_KEY = os.getenv("GENAI_API_KEY") or "REPLACE_WITH_KEY"
@@ -9,13 +11,54 @@ firecrawl = Firecrawl(api_key=FIRECRAWL_API_KEY)
 genai_client = genai.Client(api_key=GENAI_API_KEY)
 
 DEFAULT_SCRAPE_OPTS = {
-    "formats": ["markdown", "links"],
+    "formats": ["markdown"],  # links are never read
     "only_main_content": True,
     "timeout": 120000,
     "location": {"languages": ["en"]},
     "parsers": [],  # disable PDFs if you want to avoid extra cost
 }
 
+# Cheap model for short per-chunk summaries, full model for everything else
+MODEL_CHUNK = "gemini-2.5-flash-lite"
+MODEL_SYNTH = "gemini-2.5-flash"
+
+# Token counts accumulated across every _gemini_call, for cost tracking
+TOKEN_USAGE = {
+    "calls": 0,
+    "prompt_token_count": 0,
+    "cached_content_token_count": 0,
+    "candidates_token_count": 0,
+    "total_token_count": 0,
+}
+
+_RETRYABLE_CODES = {429, 500, 502, 503, 504}
+_backoff = wait_exponential_jitter(initial=1, max=30)
+
+def _is_retryable(exc):
+    return isinstance(exc, genai_errors.APIError) and exc.code in _RETRYABLE_CODES
+
+def _retry_wait(retry_state):
+    # honor the server's Retry-After header when there is one, else back off exponentially
+    response = getattr(retry_state.outcome.exception(), "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return min(float(headers.get("retry-after")), 60)
+    except (TypeError, ValueError):
+        return _backoff(retry_state)
+
+@retry(retry=retry_if_exception(_is_retryable), wait=_retry_wait, stop=stop_after_attempt(5), reraise=True)
+def _gemini_call(contents, model=MODEL_SYNTH, **kw):
+    """
+    generate_content with retry on rate limits / server errors; adds the response's
+    usage_metadata to TOKEN_USAGE.
+    """
+    resp = genai_client.models.generate_content(model=model, contents=contents, **kw)
+    usage = getattr(resp, "usage_metadata", None)
+    TOKEN_USAGE["calls"] += 1
+    for field in ("prompt_token_count", "cached_content_token_count", "candidates_token_count", "total_token_count"):
+        TOKEN_USAGE[field] += getattr(usage, field, None) or 0
+    return resp
+
 def safe_get_markdown(item):
     # handles SDK shapes: item may be dict-like or have nested 'data'
     if not item:
@@ -31,56 +74,67 @@ def safe_get_markdown(item):
     # fallback
     return ""
 
+_PARAGRAPH_BREAK = re.compile(r"(?=\n\n)")
+
 def chunk_text(text, max_chars=3000):
     # naive chunking by characters; adjust to tokens if you have a tokenizer
+    # generator: yields chunks one at a time, walking with index cursors
     text = text.strip()
-    if not text:
-        return []
-    chunks = []
-    while text:
-        chunk = text[:max_chars]
+    i, n = 0, len(text)
+    # every paragraph break offset, found once; each cut point is then a binary search
+    breaks = [m.start() for m in _PARAGRAPH_BREAK.finditer(text)]
+    while i < n:
+        end = min(i + max_chars, n)
         # try to cut at last paragraph/newline for better context
-        cut = chunk.rfind("\n\n")
-        if cut > max_chars // 2:
-            chunk = text[:cut]
-        chunks.append(chunk.strip())
-        text = text[len(chunk):].lstrip()
-    return chunks
+        k = bisect.bisect_right(breaks, end - 2) - 1
+        if k >= 0 and breaks[k] - i > max_chars // 2:
+            end = breaks[k]
+        yield text[i:end].strip()
+        i = end
+        while i < n and text[i].isspace():
+            i += 1
 
-def summarize_chunk(chunk):
-    prompt = textwrap.dedent(f"""
+_CHUNK_TMPL = textwrap.dedent("""
     Summarize this excerpt in 2-3 short sentences focused on car review insights: main issues, recurring problems, and positives.
 
     Excerpt:
     {chunk}
-    """).strip()
+""").strip()
 
-    resp = genai_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-    )
+def summarize_chunk(chunk):
+    prompt = _CHUNK_TMPL.format(chunk=chunk)
+
+    resp = _gemini_call(prompt, model=MODEL_CHUNK)
     return getattr(resp, "text", repr(resp))
 
-def summarize_document(md_text, url):
-    chunks = chunk_text(md_text, max_chars=3000)
-    if not chunks:
-        return None
-    chunk_summaries = [summarize_chunk(c) for c in chunks]
-    # combine chunk summaries into a single per-document summary
-    combined = "\n\n".join(chunk_summaries)
-    synth_prompt = textwrap.dedent(f"""
+_COMBINE_TMPL = textwrap.dedent("""
     Combine these short summaries into a 3-4 sentence summary focused on the main drawbacks, common issues, and main positives.
     Preserve source attribution at the end: {url}
 
     Summaries:
     {combined}
-    """).strip()
-    resp = genai_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=synth_prompt,
-    )
+""").strip()
+
+def summarize_document(md_text, url):
+    # chunks are streamed through summarize_chunk, only their summaries are kept
+    chunk_summaries = [summarize_chunk(c) for c in chunk_text(md_text, max_chars=3000)]
+    if not chunk_summaries:
+        return None
+    # combine chunk summaries into a single per-document summary
+    combined = "\n\n".join(chunk_summaries)
+    synth_prompt = _COMBINE_TMPL.format(url=url, combined=combined)
+    resp = _gemini_call(synth_prompt)
     return getattr(resp, "text", repr(resp))
 
+_FINAL_TMPL = textwrap.dedent("""
+    Using the following per-document summaries, produce a 2-3 paragraph concise summary of Toyota Corolla (1997) reviews.
+    Focus on: main drawbacks, common mechanical issues (with frequency), and main positives.
+    For each major point, list the source URLs that support it.
+
+    Documents:
+    {combined_summaries}
+""").strip()
+
 def search_and_summarize(query, limit=5, scrape_options=None):
     opts = DEFAULT_SCRAPE_OPTS.copy()
     if scrape_options:
@@ -102,22 +156,13 @@ def search_and_summarize(query, limit=5, scrape_options=None):
             summaries.append({"url": url, "summary": doc_summary})
     # synthesize final answer from per-document summaries
     combined_summaries = "\n\n".join([f"From {s['url']}:\n{s['summary']}" for s in summaries])
-    final_prompt = textwrap.dedent(f"""
-    Using the following per-document summaries, produce a 2-3 paragraph concise summary of Toyota Corolla (1997) reviews.
-    Focus on: main drawbacks, common mechanical issues (with frequency), and main positives.
-    For each major point, list the source URLs that support it.
-
-    Documents:
-    {combined_summaries}
-    """).strip()
-    resp = genai_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=final_prompt,
-    )
+    final_prompt = _FINAL_TMPL.format(combined_summaries=combined_summaries)
+    resp = _gemini_call(final_prompt)
     final_text = getattr(resp, "text", repr(resp))
     return final_text, summaries
 
 if __name__ == "__main__":
     final, sources = search_and_summarize("Toyota corolla 1997 buy guide", limit=3)
     print("FINAL SUMMARY:\n", final)
-    print("\nSOURCES AND PER-DOC SUMMARIES:\n", sources)
\ No newline at end of file
+    print("\nSOURCES AND PER-DOC SUMMARIES:\n", sources)
+    print("\nTOKEN USAGE:\n", TOKEN_USAGE)
\ No newline at end of file